@@ -1,7 +1,7 @@
 import os
 
 from conan import ConanFile
-from conan.tools.cmake import cmake_layout, CMake
+from conan.tools.cmake import cmake_layout, CMake, CMakeDeps, CMakeToolchain
 from conan.tools.files import copy
 
 
@@ -9,13 +9,18 @@ class VulkanAppConan(ConanFile):
     name = "vulkan_app"
     version = "0.1.0"
     settings = "os", "compiler", "build_type", "arch"
-    generators = "CMakeToolchain", "CMakeDeps"
     requires = []
     tool_requires = []
 
     def layout(self):
         cmake_layout(self)
 
+    def generate(self):
+        toolchain = CMakeToolchain(self, generator="Ninja")
+        toolchain.generate()
+        deps = CMakeDeps(self)
+        deps.generate()
+
     def requirements(self):
         self.requires(
             "spdlog/1.15.1", options={"use_std_fmt": True, "no_exceptions": True, "shared": False})
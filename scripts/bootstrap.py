@@ -0,0 +1,51 @@
+import argparse
+import pathlib
+import subprocess
+import sys
+
+repo_conf = pathlib.Path(__file__).resolve().parent / 'global.conf'
+
+
+def conan_home() -> pathlib.Path:
+    result = subprocess.run(['conan', 'config', 'home'],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        print(f'[Error] {result.stderr.strip()}', file=sys.stderr)
+        sys.exit(result.returncode)
+    return pathlib.Path(result.stdout.strip())
+
+
+def conf_key(line: str) -> str | None:
+    stripped = line.strip()
+    if not stripped or stripped.startswith('#'):
+        return None
+    for separator in ('+=', '=+', '*=', '=!', '='):
+        if separator in stripped:
+            return stripped.split(separator, 1)[0].strip()
+    return None
+
+
+def merge_conf(existing: list[str], overrides: list[str]) -> list[str]:
+    override_keys = {conf_key(line) for line in overrides} - {None}
+    kept = [line for line in existing if conf_key(line) not in override_keys]
+    return kept + overrides
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Merge the repository Conan configuration into the active CONAN_HOME.')
+    parser.add_argument('--conf', default=str(repo_conf),
+                        help='Path to the global.conf entries to install')
+    args = parser.parse_args()
+
+    target = conan_home() / 'global.conf'
+    existing = target.read_text().splitlines() if target.exists() else []
+    overrides = pathlib.Path(args.conf).read_text().splitlines()
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text('\n'.join(merge_conf(existing, overrides)) + '\n')
+    print(f'[Bootstrap] Updated {target}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,92 +1,558 @@
+import asyncio
 import os
+import re
+import json
+import functools
 import pathlib
+import shutil
 import subprocess
-import multiprocessing
 import sys
 import argparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import tempfile
+import threading
+from collections.abc import Iterator
 
-shader_extensions = ['.vert', '.frag', '.comp']
+try:
+    from blake3 import blake3 as input_hasher
+except ImportError:
+    from hashlib import sha256 as input_hasher
 
+shader_extensions = ('.vert', '.frag', '.comp')
+include_pattern = re.compile(rb'^\s*#\s*include\s+"([^"]+)"', re.MULTILINE)
+depfile_token_pattern = re.compile(r'(?:\\.|\S)+')
+glslc_flags = ('-g', '--target-env=vulkan1.4', '-x', 'glsl', '-Werror')
+spirv_opt_flags = ('-O', '--preserve-bindings', '--preserve-interface')
+default_cache_max_entries = 4096
 
-def find_shaders(shader_source_dir: pathlib.Path) -> list[pathlib.Path]:
-    return [p for p in shader_source_dir.rglob('*') if p.suffix in shader_extensions]
 
+def find_shaders(shader_source_dir: pathlib.Path) -> Iterator[pathlib.Path]:
+    stack = [str(shader_source_dir)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(shader_extensions):
+                    yield pathlib.Path(entry.path)
+
+
+def resolve_include(name: str, including_file: pathlib.Path, include_dir: pathlib.Path) -> pathlib.Path | None:
+    for candidate in (including_file.parent / name, include_dir / name):
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def scan_includes(shader_path: pathlib.Path, include_dir: pathlib.Path) -> list[pathlib.Path]:
+    includes: list[pathlib.Path] = []
+    visited: set[pathlib.Path] = {shader_path}
+    stack = [shader_path]
+
+    while stack:
+        path = stack.pop()
+        for match in include_pattern.finditer(path.read_bytes()):
+            resolved = resolve_include(match.group(1).decode(), path, include_dir)
+            if resolved is not None and resolved not in visited:
+                visited.add(resolved)
+                includes.append(resolved)
+                stack.append(resolved)
+
+    return includes
+
+
+def depfile_path(output_spv: pathlib.Path) -> pathlib.Path:
+    return output_spv.with_suffix('.spv.d')
+
+
+def read_depfile(output_spv: pathlib.Path) -> list[pathlib.Path] | None:
+    try:
+        text = depfile_path(output_spv).read_text()
+    except OSError:
+        return None
+
+    _, _, dependencies = text.replace('\\\n', ' ').partition(': ')
+    return [pathlib.Path(token.replace('\\ ', ' ')) for token in depfile_token_pattern.findall(dependencies)]
+
+
+def shader_dependencies(shader_path: pathlib.Path, output_spv: pathlib.Path, include_dir: pathlib.Path) -> list[pathlib.Path]:
+    dependencies = read_depfile(output_spv)
+    if dependencies is None:
+        return scan_includes(shader_path, include_dir)
+    return [dependency for dependency in dependencies if dependency != shader_path]
+
+
+def compute_input_hash(shader_path: pathlib.Path, dependencies: list[pathlib.Path]) -> str:
+    hasher = input_hasher()
+    hasher.update(shader_path.name.encode())
+    hasher.update(shader_path.read_bytes())
+
+    for dependency in sorted(set(dependencies), key=lambda path: (path.name, str(path))):
+        hasher.update(dependency.name.encode())
+        try:
+            hasher.update(dependency.read_bytes())
+        except OSError:
+            hasher.update(b'<missing>')
+
+    return hasher.hexdigest()
+
+
+@functools.cache
+def glslc_version() -> str:
+    result = subprocess.run(['glslc', '--version'],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return result.stdout.splitlines()[0] if result.stdout else ''
+
+
+@functools.cache
+def worker_version(worker: pathlib.Path) -> str:
+    result = subprocess.run([str(worker), '--version'], stdin=subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    version = result.stdout.strip() if result.returncode == 0 else ''
+    if not version:
+        worker_stat = worker.stat()
+        version = f'{worker.name} {worker_stat.st_size} {worker_stat.st_mtime_ns}'
+    return version
+
+
+def dep_path(output_spv: pathlib.Path) -> pathlib.Path:
+    return output_spv.with_suffix('.spv.dep')
+
+
+def is_up_to_date(output_spv: pathlib.Path, dep: dict, existing_outputs: set[str] | None = None) -> bool:
+    if existing_outputs is None:
+        if not output_spv.exists():
+            return False
+    elif output_spv.name not in existing_outputs or dep_path(output_spv).name not in existing_outputs:
+        return False
+
+    try:
+        return json.loads(dep_path(output_spv).read_text()) == dep
+    except (OSError, ValueError):
+        return False
+
+
+def list_outputs(shader_binary_dir: pathlib.Path) -> set[str]:
+    with os.scandir(shader_binary_dir) as entries:
+        return {entry.name for entry in entries if entry.name.endswith(('.spv', '.spv.dep'))}
+
+
+def write_dep(output_spv: pathlib.Path, dep: dict) -> None:
+    dep_path(output_spv).write_text(json.dumps(dep))
+
+
+def shader_cache_dir() -> pathlib.Path | None:
+    cache_dir = os.environ.get(
+        'SHADER_CACHE_DIR', str(pathlib.Path.home() / '.cache' / 'dyn-render' / 'spirv'))
+    return pathlib.Path(cache_dir) if cache_dir else None
+
+
+def cache_key(dep: dict) -> str:
+    return input_hasher(json.dumps(dep, sort_keys=True).encode()).hexdigest()
+
+
+def cache_max_entries() -> int:
+    try:
+        return int(os.environ.get('SHADER_CACHE_MAX_ENTRIES', default_cache_max_entries))
+    except ValueError:
+        print(
+            f'[Warning] Ignoring invalid SHADER_CACHE_MAX_ENTRIES={os.environ["SHADER_CACHE_MAX_ENTRIES"]!r}', file=sys.stderr)
+        return default_cache_max_entries
+
+
+def prune_cache(max_entries: int) -> None:
+    cache_dir = shader_cache_dir()
+    if cache_dir is None:
+        return
+
+    try:
+        with os.scandir(cache_dir) as entries:
+            cached = sorted(((entry.stat().st_mtime_ns, entry.path) for entry in entries
+                             if entry.name.endswith('.spv')), reverse=True)
+    except OSError:
+        return
+
+    for _, path in cached[max(0, max_entries):]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def restore_from_cache(output_spv: pathlib.Path, dep: dict) -> bool:
+    cache_dir = shader_cache_dir()
+    if cache_dir is None:
+        return False
+
+    cached_spv = cache_dir / f'{cache_key(dep)}.spv'
+    if not cached_spv.is_file():
+        return False
+
+    output_spv.unlink(missing_ok=True)
+    try:
+        os.link(cached_spv, output_spv)
+    except OSError:
+        shutil.copyfile(cached_spv, output_spv)
+    write_dep(output_spv, dep)
+    return True
+
+
+def store_in_cache(output_spv: pathlib.Path, dep: dict) -> None:
+    cache_dir = shader_cache_dir()
+    if cache_dir is None:
+        return
+
+    key = cache_key(dep)
+    staging = cache_dir / f'{key}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        try:
+            shutil.copyfile(output_spv, staging)
+        except FileNotFoundError:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(output_spv, staging)
+        os.replace(staging, cache_dir / f'{key}.spv')
+    except OSError as e:
+        staging.unlink(missing_ok=True)
+        print(
+            f'[Warning] Could not cache {output_spv.name}: {e}', file=sys.stderr)
+
+
+def finish_compile(shader_path: pathlib.Path, output_spv: pathlib.Path, dep: dict, dependencies: list[pathlib.Path], store: bool = True) -> None:
+    compiled_dependencies = read_depfile(output_spv)
+    if compiled_dependencies is not None:
+        compiled_dependencies = [
+            dependency for dependency in compiled_dependencies if dependency != shader_path]
+        if set(compiled_dependencies) != set(dependencies):
+            dep = shader_dep(shader_path, compiled_dependencies,
+                             dep['compiler_version'], dep['optimize'])
+
+    write_dep(output_spv, dep)
+    if store:
+        store_in_cache(output_spv, dep)
+
+
+def shader_dep(shader_path: pathlib.Path, dependencies: list[pathlib.Path], compiler_version: str, optimize: bool) -> dict:
+    return {
+        'input_hash': compute_input_hash(shader_path, dependencies),
+        'compiler_version': compiler_version,
+        'compile_flags': list(glslc_flags),
+        'optimize': optimize,
+        'optimizer_flags': list(spirv_opt_flags) if optimize else [],
+    }
+
+
+@functools.cache
+def glslc_base_command(include_dir: pathlib.Path) -> tuple[str, ...]:
+    return ('glslc', '-I', str(include_dir), *glslc_flags)
+
+
+def temp_output_path(output_spv: pathlib.Path) -> pathlib.Path:
+    return output_spv.with_suffix('.spv.tmp')
 
-def compile_shader(args: tuple[pathlib.Path, pathlib.Path, pathlib.Path, bool, bool]) -> tuple[pathlib.Path, bool, str]:
-    shader_path, shader_binary_dir, include_dir, optimize, force = args
-    shader_binary_dir.mkdir(parents=True, exist_ok=True)
-    output_spv = shader_binary_dir / (shader_path.name + '.spv')
 
-    if not force and output_spv.exists() and output_spv.stat().st_mtime >= shader_path.stat().st_mtime:
+def glslc_command(base_command: tuple[str, ...], shader_path: pathlib.Path, output_spv: pathlib.Path) -> list[str]:
+    output = str(output_spv)
+    return [*base_command, str(shader_path), '-o', str(temp_output_path(output_spv)),
+            '-MD', '-MF', output + '.d', '-MT', output]
+
+
+def spirv_opt_command(output_spv: pathlib.Path) -> list[str]:
+    return ['spirv-opt', *spirv_opt_flags, str(output_spv), '-o', str(output_spv)]
+
+
+def compile_shader(args: tuple[pathlib.Path, pathlib.Path, pathlib.Path, bool, bool, bool]) -> tuple[pathlib.Path, bool, str]:
+    shader_path, output_spv, include_dir, optimize, force, store = args
+    dependencies = shader_dependencies(shader_path, output_spv, include_dir)
+    dep = shader_dep(shader_path, dependencies, glslc_version(), optimize)
+
+    if not force and (is_up_to_date(output_spv, dep) or restore_from_cache(output_spv, dep)):
         return shader_path, False, ''
 
+    temp_spv = temp_output_path(output_spv)
     result = subprocess.run(
-        [
-            'glslc',
-            str(shader_path),
-            '-o', str(output_spv),
-            '-g',
-            '-I', str(include_dir),
-            '--target-env=vulkan1.4',
-            '-x', 'glsl',
-            '-Werror'
-        ],
+        glslc_command(glslc_base_command(include_dir), shader_path, output_spv),
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         text=True
     )
 
     if result.returncode != 0:
-        print(
-            f'[Error] {shader_path.name}: {result.stderr.strip()}', file=sys.stderr)
+        temp_spv.unlink(missing_ok=True)
         return shader_path, True, result.stderr.strip()
 
     if optimize:
         opt_result = subprocess.run(
-            ['spirv-opt', '-O', '--preserve-bindings', '--preserve-interface',
-                str(output_spv), '-o', str(output_spv)],
+            spirv_opt_command(temp_spv),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True
         )
         if opt_result.returncode != 0:
+            temp_spv.unlink(missing_ok=True)
             return shader_path, True, opt_result.stderr.strip()
 
+    os.replace(temp_spv, output_spv)
+    finish_compile(shader_path, output_spv, dep, dependencies, store)
     return shader_path, True, ''
 
 
-def compile_all_shaders(shader_source_dir: pathlib.Path, shader_binary_dir: pathlib.Path, optimize: bool, force: bool) -> None:
-    include_dir = shader_source_dir / 'include'
-    shaders = find_shaders(shader_source_dir)
+def compile_shader_batch(shader_paths: list[pathlib.Path], shader_binary_dir: pathlib.Path, include_dir: pathlib.Path, optimize: bool, store: bool = True) -> list[tuple[pathlib.Path, bool, str]]:
+    compiler_version = glslc_version()
+    results: list[tuple[pathlib.Path, bool, str]] = []
+    stale: list[tuple[pathlib.Path, pathlib.Path, dict, list[pathlib.Path]]] = []
+
+    for shader_path in shader_paths:
+        output_spv = shader_binary_dir / (shader_path.name + '.spv')
+        try:
+            dependencies = shader_dependencies(
+                shader_path, output_spv, include_dir)
+            dep = shader_dep(shader_path, dependencies,
+                             compiler_version, optimize)
+        except OSError as e:
+            results.append((shader_path, True, str(e)))
+            continue
+
+        if is_up_to_date(output_spv, dep) or restore_from_cache(output_spv, dep):
+            results.append((shader_path, False, ''))
+        else:
+            stale.append((shader_path, output_spv, dep, dependencies))
+
+    if len(stale) <= 1:
+        return results + [compile_shader((shader_path, output_spv, include_dir, optimize, True, store))
+                          for shader_path, output_spv, _, _ in stale]
+
+    with tempfile.TemporaryDirectory(prefix='.batch-', dir=shader_binary_dir) as scratch:
+        result = subprocess.run(
+            [*glslc_base_command(include_dir), '-c', '-MD',
+             *(str(shader_path) for shader_path, _, _, _ in stale)],
+            cwd=scratch,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+
+        if result.returncode != 0:
+            return results + [compile_shader((shader_path, output_spv, include_dir, optimize, True, store))
+                              for shader_path, output_spv, _, _ in stale]
+
+        for shader_path, output_spv, dep, dependencies in stale:
+            scratch_spv = pathlib.Path(scratch) / output_spv.name
+            if optimize:
+                opt_result = subprocess.run(
+                    spirv_opt_command(scratch_spv),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True
+                )
+                if opt_result.returncode != 0:
+                    results.append(
+                        (shader_path, True, opt_result.stderr.strip()))
+                    continue
+
+            os.replace(depfile_path(scratch_spv), depfile_path(output_spv))
+            os.replace(scratch_spv, output_spv)
+            finish_compile(shader_path, output_spv,
+                           dep, dependencies, store)
+            results.append((shader_path, True, ''))
+
+    return results
+
+
+def shader_jobs(shader_count: int) -> int:
+    default = min(os.cpu_count() or 1, shader_count)
+    try:
+        jobs = int(os.environ.get('SHADER_JOBS', default))
+    except ValueError:
+        print(
+            f'[Warning] Ignoring invalid SHADER_JOBS={os.environ["SHADER_JOBS"]!r}', file=sys.stderr)
+        jobs = default
+    return max(1, jobs)
+
+
+async def run_process(command: list[str]) -> tuple[int, str]:
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await process.communicate()
+    return process.returncode, stderr.decode(errors='replace').strip()
+
+
+class ShaderWorker:
+    def __init__(self, executable: pathlib.Path, include_dir: pathlib.Path):
+        self._executable = executable
+        self._include_dir = include_dir
+        self._process: asyncio.subprocess.Process | None = None
+
+    async def start(self) -> None:
+        self._process = await asyncio.create_subprocess_exec(
+            str(self._executable), str(self._include_dir),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+
+    async def compile(self, shader_path: pathlib.Path) -> tuple[bool, bytes]:
+        self._process.stdin.write(f'{shader_path}\n'.encode())
+        await self._process.stdin.drain()
+
+        header = await self._process.stdout.readline()
+        if not header:
+            raise RuntimeError(
+                f'Shader worker exited with code {await self._process.wait()}')
+
+        status, size = header.split()
+        return status == b'ok', await self._process.stdout.readexactly(int(size))
+
+    async def close(self) -> None:
+        if self._process is None or self._process.returncode is not None:
+            return
+        self._process.stdin.close()
+        await self._process.wait()
+
+
+async def compile_with_glslc(base_command: tuple[str, ...], shader_path: pathlib.Path, output_spv: pathlib.Path, optimize: bool, semaphore: asyncio.Semaphore) -> str:
+    temp_spv = temp_output_path(output_spv)
+    async with semaphore:
+        returncode, error = await run_process(glslc_command(base_command, shader_path, output_spv))
+        if returncode != 0:
+            temp_spv.unlink(missing_ok=True)
+            return error
+
+        if optimize:
+            returncode, error = await run_process(spirv_opt_command(temp_spv))
+            if returncode != 0:
+                temp_spv.unlink(missing_ok=True)
+                return error
+
+    os.replace(temp_spv, output_spv)
+    return ''
+
+
+async def compile_with_worker(shader_path: pathlib.Path, output_spv: pathlib.Path, optimize: bool, workers: asyncio.Queue[ShaderWorker]) -> str:
+    worker = await workers.get()
+    try:
+        try:
+            ok, payload = await worker.compile(shader_path)
+        except (OSError, RuntimeError, ValueError, asyncio.IncompleteReadError) as e:
+            await worker.close()
+            await worker.start()
+            return str(e)
+    finally:
+        workers.put_nowait(worker)
+
+    if not ok:
+        return payload.decode(errors='replace').strip()
+
+    temp_spv = temp_output_path(output_spv)
+    temp_spv.write_bytes(payload)
+
+    if optimize:
+        returncode, error = await run_process(spirv_opt_command(temp_spv))
+        if returncode != 0:
+            temp_spv.unlink(missing_ok=True)
+            return error
+
+    depfile_path(output_spv).unlink(missing_ok=True)
+    os.replace(temp_spv, output_spv)
+    return ''
+
+
+async def compile_all_shaders(shader_source_dir: pathlib.Path, shader_binary_dir: pathlib.Path, optimize: bool, force: bool, worker: pathlib.Path | None = None) -> set[pathlib.Path]:
+    return await compile_shader_subset(list(find_shaders(shader_source_dir)), shader_source_dir / 'include',
+                                       shader_binary_dir, optimize, force, worker)
+
+
+async def compile_shader_subset(shaders: list[pathlib.Path], include_dir: pathlib.Path, shader_binary_dir: pathlib.Path, optimize: bool, force: bool, worker: pathlib.Path | None = None) -> set[pathlib.Path]:
     total = len(shaders)
+    failed: set[pathlib.Path] = set()
 
     if total == 0:
-        return
+        return failed
+
+    shader_binary_dir.mkdir(parents=True, exist_ok=True)
+
+    if worker is not None:
+        compiler_version = worker_version(worker)
+    else:
+        compiler_version = glslc_version()
+
+    completed = 0
+
+    def report(shader_path: pathlib.Path, was_compiled: bool, error: str) -> None:
+        nonlocal completed
+        completed += 1
+
+        if error:
+            failed.add(shader_path)
+            print(
+                f'[Error] {shader_path.name}: {error}', file=sys.stderr)
+
+        status = 'Compiled' if was_compiled else 'Up-to-date'
+        print(f'[{completed}/{total}] {status}: {shader_path.name}')
+
+    existing_outputs = list_outputs(shader_binary_dir)
+    stale: list[tuple[pathlib.Path, pathlib.Path, dict, list[pathlib.Path]]] = []
+    for shader in shaders:
+        output_spv = shader_binary_dir / (shader.name + '.spv')
+        dependencies = shader_dependencies(shader, output_spv, include_dir)
+        dep = shader_dep(shader, dependencies, compiler_version, optimize)
+        if not force and (is_up_to_date(output_spv, dep, existing_outputs) or restore_from_cache(output_spv, dep)):
+            report(shader, False, '')
+        else:
+            stale.append((shader, output_spv, dep, dependencies))
+
+    if not stale:
+        return failed
+
+    jobs = shader_jobs(len(stale))
+    print(f'Compiling {len(stale)} shaders with {jobs} jobs')
+
+    workers: asyncio.Queue[ShaderWorker] = asyncio.Queue()
+    semaphore = asyncio.Semaphore(jobs)
+    base_command = glslc_base_command(include_dir)
+
+    async def _one(shader: pathlib.Path, output_spv: pathlib.Path, dep: dict, dependencies: list[pathlib.Path]) -> None:
+        try:
+            if worker is not None:
+                error = await compile_with_worker(shader, output_spv, optimize, workers)
+            else:
+                error = await compile_with_glslc(base_command, shader, output_spv, optimize, semaphore)
+        except Exception as e:
+            error = str(e)
+
+        if not error:
+            finish_compile(shader, output_spv, dep, dependencies)
+        report(shader, True, error)
 
-    with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
-        shader_args = [(shader, shader_binary_dir, include_dir,
-                        optimize, force) for shader in shaders]
-        future_to_shader = {executor.submit(
-            compile_shader, arg): arg[0] for arg in shader_args}
+    tasks: list[asyncio.Task] = []
+    try:
+        if worker is not None:
+            for _ in range(jobs):
+                shader_worker = ShaderWorker(worker, include_dir)
+                await shader_worker.start()
+                workers.put_nowait(shader_worker)
 
-        for i, future in enumerate(as_completed(future_to_shader), start=1):
-            try:
-                shader_path, was_compiled, error = future.result()
+        tasks = [asyncio.create_task(_one(*entry)) for entry in stale]
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
-                if error:
-                    print(
-                        f'[Error] {shader_path.name}: {error}', file=sys.stderr)
+        while not workers.empty():
+            await workers.get_nowait().close()
 
-                status = 'Compiled' if was_compiled else 'Up-to-date'
-                print(f'[{i}/{total}] {status}: {shader_path.name}')
-            except Exception as e:
-                print(e)
+    prune_cache(cache_max_entries())
+    return failed
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(
-        description='Compile GLSL shaders to SPIR-V using glslc.')
+        description='Compile GLSL shaders to SPIR-V using glslc.',
+        epilog='Compiled SPIR-V is shared across checkouts in SHADER_CACHE_DIR '
+               '(default ~/.cache/dyn-render/spirv, empty to disable). After each build the '
+               f'oldest entries beyond SHADER_CACHE_MAX_ENTRIES (default {default_cache_max_entries}) are pruned. '
+               'SHADER_JOBS overrides the number of parallel compiles.')
     parser.add_argument('--source', required=True,
                         help='Path to the shader source directory')
     parser.add_argument('--output', required=True,
@@ -94,11 +560,14 @@ def main() -> None:
     parser.add_argument('--optimize', action='store_true',
                         help='Run spirv-opt -O on compiled shaders')
     parser.add_argument('--force', action='store_true',
-                        help='Force recompilation of all shaders regardless of timestamps')
+                        help='Force recompilation of all shaders regardless of cached input hashes')
+    parser.add_argument('--worker',
+                        help='Path to a shaderc_worker executable to compile with instead of glslc')
     args = parser.parse_args()
 
-    compile_all_shaders(pathlib.Path(args.source), pathlib.Path(
-        args.output), args.optimize, args.force)
+    asyncio.run(compile_all_shaders(pathlib.Path(args.source), pathlib.Path(
+        args.output), args.optimize, args.force,
+        pathlib.Path(args.worker) if args.worker else None))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,52 @@
+import argparse
+import pathlib
+import subprocess
+import sys
+
+repo_root = pathlib.Path(__file__).resolve().parent.parent
+
+
+def lock(conanfile: pathlib.Path, lockfile: pathlib.Path, profiles: list[str]) -> int:
+    for profile in profiles:
+        command = [
+            'conan', 'lock', 'create', str(conanfile),
+            '--profile:host', profile,
+            '--profile:build', profile,
+            '--build=*',
+            '--lockfile-out', str(lockfile),
+        ]
+        if lockfile.exists():
+            command += ['--lockfile', str(lockfile)]
+
+        print(f'[Lock] {conanfile.name} with profile {profile}')
+        result = subprocess.run(command)
+        if result.returncode != 0:
+            print(
+                f'[Error] conan lock create failed for profile {profile}', file=sys.stderr)
+            return result.returncode
+
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Create or extend conan.lock so conan install can skip version range resolution.')
+    parser.add_argument('--conanfile', default=str(repo_root / 'conanfile.py'),
+                        help='Path to the Conan recipe to lock')
+    parser.add_argument('--lockfile', default=str(repo_root / 'conan.lock'),
+                        help='Path to the lockfile to create or extend')
+    parser.add_argument('--profile', action='append',
+                        help='Conan profile to resolve with; repeat to merge several profiles into one lock')
+    parser.add_argument('--clean', action='store_true',
+                        help='Discard the existing lockfile instead of extending it')
+    args = parser.parse_args()
+
+    lockfile = pathlib.Path(args.lockfile)
+    if args.clean:
+        lockfile.unlink(missing_ok=True)
+
+    sys.exit(lock(pathlib.Path(args.conanfile), lockfile, args.profile or ['default']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+#include <shaderc/shaderc.hpp>
+
+#include <cstdint>
+#include <filesystem>
+#include <fstream>
+#include <iostream>
+#include <iterator>
+#include <memory>
+#include <optional>
+#include <string>
+#include <string_view>
+#include <utility>
+
+#ifdef _WIN32
+#include <fcntl.h>
+#include <io.h>
+#endif
+
+#ifndef SHADERC_WORKER_SDK_VERSION
+#define SHADERC_WORKER_SDK_VERSION "unknown"
+#endif
+
+namespace {
+
+// Mirrors the options set in main() so that --version changes with them.
+constexpr std::string_view compile_flags =
+  "--target-env=vulkan1.4 -x glsl -g -Werror";
+
+struct IncludeResult
+{
+  std::string name;
+  std::string content;
+  shaderc_include_result result{};
+};
+
+auto
+read_file(const std::filesystem::path& path) -> std::optional<std::string>
+{
+  std::ifstream file(path, std::ios::binary);
+  if (!file.is_open())
+    return std::nullopt;
+
+  return std::string{ std::istreambuf_iterator<char>(file),
+                      std::istreambuf_iterator<char>() };
+}
+
+auto
+shader_kind(const std::filesystem::path& path)
+  -> std::optional<shaderc_shader_kind>
+{
+  const auto extension = path.extension();
+  if (extension == ".vert")
+    return shaderc_vertex_shader;
+  if (extension == ".frag")
+    return shaderc_fragment_shader;
+  if (extension == ".comp")
+    return shaderc_compute_shader;
+  return std::nullopt;
+}
+
+class Includer final : public shaderc::CompileOptions::IncluderInterface
+{
+public:
+  explicit Includer(std::filesystem::path include_dir)
+    : include_dir(std::move(include_dir))
+  {
+  }
+
+  auto GetInclude(const char* requested_source,
+                  shaderc_include_type type,
+                  const char* requesting_source,
+                  size_t) -> shaderc_include_result* override
+  {
+    auto* include = new IncludeResult{};
+
+    std::optional<std::filesystem::path> resolved;
+    if (type == shaderc_include_type_relative) {
+      auto candidate =
+        std::filesystem::path{ requesting_source }.parent_path() /
+        requested_source;
+      if (std::filesystem::exists(candidate))
+        resolved = candidate;
+    }
+    if (!resolved) {
+      auto candidate = include_dir / requested_source;
+      if (std::filesystem::exists(candidate))
+        resolved = candidate;
+    }
+
+    if (auto content = resolved ? read_file(*resolved) : std::nullopt) {
+      include->name = resolved->string();
+      include->content = std::move(*content);
+    } else {
+      include->content =
+        "Could not resolve include: " + std::string{ requested_source };
+    }
+
+    include->result = shaderc_include_result{
+      .source_name = include->name.data(),
+      .source_name_length = include->name.size(),
+      .content = include->content.data(),
+      .content_length = include->content.size(),
+      .user_data = include,
+    };
+    return &include->result;
+  }
+
+  auto ReleaseInclude(shaderc_include_result* data) -> void override
+  {
+    delete static_cast<IncludeResult*>(data->user_data);
+  }
+
+private:
+  std::filesystem::path include_dir;
+};
+
+auto
+write_response(std::string_view status, std::string_view payload) -> void
+{
+  std::cout << status << ' ' << payload.size() << '\n';
+  std::cout.write(payload.data(), static_cast<std::streamsize>(payload.size()));
+  std::cout.flush();
+}
+
+auto
+compile(const shaderc::Compiler& compiler,
+        const shaderc::CompileOptions& options,
+        const std::filesystem::path& path) -> void
+{
+  const auto kind = shader_kind(path);
+  if (!kind) {
+    write_response("err", "Unknown shader stage: " + path.string());
+    return;
+  }
+
+  const auto source = read_file(path);
+  if (!source) {
+    write_response("err", "Could not open file: " + path.string());
+    return;
+  }
+
+  const auto result =
+    compiler.CompileGlslToSpv(*source, *kind, path.string().c_str(), options);
+  if (result.GetCompilationStatus() != shaderc_compilation_status_success) {
+    write_response("err", result.GetErrorMessage());
+    return;
+  }
+
+  const std::string_view binary{
+    reinterpret_cast<const char*>(result.cbegin()),
+    static_cast<size_t>(result.cend() - result.cbegin()) * sizeof(std::uint32_t)
+  };
+  write_response("ok", binary);
+}
+
+auto
+write_version() -> void
+{
+  unsigned int spirv_version = 0;
+  unsigned int spirv_revision = 0;
+  shaderc_get_spv_version(&spirv_version, &spirv_revision);
+
+  std::cout << "shaderc_worker " << SHADERC_WORKER_SDK_VERSION << " spirv "
+            << spirv_version << '.' << spirv_revision << ' ' << compile_flags
+            << std::endl;
+}
+
+} // namespace
+
+/**
+ * @brief Long-lived shader compiler driven by scripts/compile_shaders.py.
+ *
+ * Reads one shader path per line from stdin and answers each with
+ * "ok <size>\n<spir-v>" or "err <size>\n<message>" on stdout, so the cost of
+ * starting a compiler is paid once per worker instead of once per shader.
+ *
+ * "--version" prints the SDK, SPIR-V version and options the worker compiles
+ * with, which compile_shaders.py uses as the compiler identity for its caches.
+ *
+ * Usage: shaderc_worker <include_dir> | --version
+ */
+int
+main(int argc, char** argv)
+{
+  if (argc != 2) {
+    std::cerr << "Usage: " << argv[0] << " <include_dir> | --version"
+              << std::endl;
+    return 1;
+  }
+
+  if (std::string_view{ argv[1] } == "--version") {
+    write_version();
+    return 0;
+  }
+
+  std::ios::sync_with_stdio(false);
+#ifdef _WIN32
+  _setmode(_fileno(stdout), _O_BINARY);
+#endif
+
+  shaderc::Compiler compiler;
+  shaderc::CompileOptions options;
+  options.SetTargetEnvironment(shaderc_target_env_vulkan,
+                               shaderc_env_version_vulkan_1_4);
+  options.SetSourceLanguage(shaderc_source_language_glsl);
+  options.SetGenerateDebugInfo();
+  options.SetWarningsAsErrors();
+  options.SetIncluder(std::make_unique<Includer>(argv[1]));
+
+  std::string line;
+  while (std::getline(std::cin, line)) {
+    if (!line.empty() && line.back() == '\r')
+      line.pop_back();
+    if (line.empty())
+      continue;
+    compile(compiler, options, line);
+  }
+
+  return 0;
+}
@@ -1,23 +1,204 @@
 import asyncio
+import functools
+import hashlib
+import mmap
+import multiprocessing
+import os
 import pathlib
+import struct
 import subprocess
 import sys
 import signal
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Final
 from watchdog.observers import Observer
-from colorama import Fore, Style, init as init_colorama
-from watchdog.events import FileSystemEventHandler, FileModifiedEvent
+from watchdog.observers.api import BaseObserver
+from watchdog.observers.polling import PollingObserver
+from colorama import Fore, Style, just_fix_windows_console
+from watchdog.events import (
+    EVENT_TYPE_CREATED,
+    EVENT_TYPE_DELETED,
+    EVENT_TYPE_MODIFIED,
+    EVENT_TYPE_MOVED,
+    FileSystemEvent,
+    PatternMatchingEventHandler,
+)
+
+from compile_shaders import (
+    cache_key,
+    compile_shader_batch,
+    find_shaders,
+    glslc_version,
+    shader_dep,
+    shader_dependencies,
+)
+
+just_fix_windows_console()
+
+SHADER_EXTENSIONS: Final = ('.vert', '.frag', '.comp')
+OUTPUT_SUFFIXES: Final = ('.spv', '.spv.d', '.spv.dep')
+DEBOUNCE_SECONDS: Final = 0.3
+HASH_CACHE_NAME: Final = '.shader_cache.bin'
+HASH_RECORD: Final = struct.Struct('<Q32sQ')
+HASH_CACHE_COMPACT_FACTOR: Final = 4
+HASH_CACHE_COMPACT_MINIMUM: Final = 64
+UNLINK_WORKERS: Final = 8
+STATUS_INTERVAL_SECONDS: Final = 0.1
 
-from compile_shaders import compile_all_shaders, compile_shader
+STATUS_PREFIX: Final = f'{Fore.BLUE}[Status] Pending shaders: '.encode()
+STATUS_SUFFIX: Final = f'{Style.RESET_ALL}\r'.encode()
+ERROR_PREFIX: Final = f'{Fore.RED}[Error] '.encode()
+NOTICE_PREFIX: Final = Fore.YELLOW.encode()
+LINE_SUFFIX: Final = f'{Style.RESET_ALL}\n'.encode()
+CLEANING_LINE: Final = NOTICE_PREFIX + b'Cleaning orphaned SPIR-V outputs...' + LINE_SUFFIX
+REBUILD_DONE_LINE: Final = f'{Fore.CYAN}[Done] Rebuild of changed shaders finished'.encode() + \
+    LINE_SUFFIX
+COMPILE_EVENT_TYPES: Final = {EVENT_TYPE_MODIFIED,
+                              EVENT_TYPE_CREATED, EVENT_TYPE_MOVED}
+REMOVE_EVENT_TYPES: Final = {EVENT_TYPE_DELETED, EVENT_TYPE_MOVED}
+SHADER_PATTERNS: Final = sorted(f'*{ext}' for ext in SHADER_EXTENSIONS)
+IGNORE_PATTERNS: Final = ['*.spv', '*/.git/*']
 
-init_colorama()
 
-SHADER_EXTENSIONS: Final = {'.vert', '.frag', '.comp'}
-DEBOUNCE_SECONDS: Final = 0.3
+def should_compile(src: str) -> bool:
+    return src.endswith(SHADER_EXTENSIONS)
+
+
+def write_raw(data: bytes) -> None:
+    sys.stdout.flush()
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.flush()
+
+
+def write_error(message: str) -> None:
+    write_raw(ERROR_PREFIX + message.encode(errors='replace') + LINE_SUFFIX)
+
+
+def iter_outputs(root: str) -> Iterator[str]:
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(OUTPUT_SUFFIXES):
+                    yield entry.path
+
+
+def spv_name(output: str) -> str:
+    name = os.path.basename(output)
+    return name[:name.rindex('.spv') + len('.spv')]
+
+
+def remove_file(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError as e:
+        write_error(f'Failed to delete {path}: {e}')
+
 
+def shader_key(path: pathlib.Path, output_spv: pathlib.Path, include_dir: pathlib.Path, optimize: bool) -> str | None:
+    try:
+        dependencies = shader_dependencies(path, output_spv, include_dir)
+        return cache_key(shader_dep(path, dependencies, glslc_version(), optimize))
+    except OSError:
+        return None
 
-def should_compile(path: pathlib.Path) -> bool:
-    return path.suffix in SHADER_EXTENSIONS
+
+def warm_worker() -> int:
+    return os.getpid()
+
+
+def ignored_output_prefix(source_dir: pathlib.Path, output_dir: pathlib.Path) -> str | None:
+    if output_dir != source_dir and output_dir.is_relative_to(source_dir):
+        return os.path.join(str(output_dir), '')
+    return None
+
+
+def output_mtime(output_spv: pathlib.Path) -> int | None:
+    try:
+        return output_spv.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+class ShaderHashCache:
+    def __init__(self, cache_path: pathlib.Path):
+        self._cache_path = cache_path
+        self._records: dict[int, tuple[bytes, int]] = {}
+        self._record_count = 0
+        self._fd: int | None = None
+        self._load()
+
+    @staticmethod
+    def _path_id(path: pathlib.Path) -> int:
+        return int.from_bytes(hashlib.blake2b(str(path).encode(), digest_size=8).digest(), 'little')
+
+    def _load(self) -> None:
+        try:
+            with open(self._cache_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                size = len(data)
+                usable = size - size % HASH_RECORD.size
+                with memoryview(data)[:usable] as records:
+                    for path_id, content_hash, mtime in HASH_RECORD.iter_unpack(records):
+                        self._records[path_id] = (content_hash, mtime)
+                self._record_count = usable // HASH_RECORD.size
+        except (OSError, ValueError):
+            self._records.clear()
+            self._record_count = 0
+            return
+
+        if usable != size:
+            try:
+                os.truncate(self._cache_path, usable)
+            except OSError as e:
+                print(
+                    f'{Fore.RED}[Warning] Could not repair {self._cache_path.name}: {e}{Style.RESET_ALL}')
+
+    def is_current(self, path: pathlib.Path, key: str | None, output_spv: pathlib.Path) -> bool:
+        if key is None:
+            return False
+        record = self._records.get(self._path_id(path))
+        return record is not None and record == (bytes.fromhex(key), output_mtime(output_spv))
+
+    def record(self, path: pathlib.Path, key: str, output_spv: pathlib.Path) -> None:
+        mtime = output_mtime(output_spv)
+        if mtime is None:
+            return
+
+        path_id = self._path_id(path)
+        content_hash = bytes.fromhex(key)
+        self._records[path_id] = (content_hash, mtime)
+        try:
+            if self._fd is None:
+                flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+                self._fd = os.open(self._cache_path, flags, 0o644)
+            os.write(self._fd, HASH_RECORD.pack(path_id, content_hash, mtime))
+            self._record_count += 1
+            if self._record_count > max(HASH_CACHE_COMPACT_MINIMUM, HASH_CACHE_COMPACT_FACTOR * len(self._records)):
+                self._compact()
+        except OSError as e:
+            print(
+                f'{Fore.RED}[Warning] Could not write {self._cache_path.name}: {e}{Style.RESET_ALL}')
+
+    def _compact(self) -> None:
+        staging = self._cache_path.with_name(
+            f'{self._cache_path.name}.{os.getpid()}.tmp')
+        try:
+            staging.write_bytes(b''.join(HASH_RECORD.pack(path_id, content_hash, mtime)
+                                         for path_id, (content_hash, mtime) in self._records.items()))
+            self.close()
+            os.replace(staging, self._cache_path)
+        except OSError:
+            staging.unlink(missing_ok=True)
+            raise
+        self._record_count = len(self._records)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
 
 
 class DebouncedCompiler:
@@ -34,70 +215,322 @@ class DebouncedCompiler:
         self._include_dir = include_dir
         self._source_dir = source_dir
         self._optimize = optimize
-        self._tasks: dict[pathlib.Path, asyncio.TimerHandle] = {}
+        self._pending: set[pathlib.Path] = set()
+        self._timer: asyncio.TimerHandle | None = None
+        self._deadline = 0.0
+        self._known_sources: set[pathlib.Path] | None = None
+        self._jobs = os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(
+            max_workers=self._jobs, mp_context=multiprocessing.get_context('spawn'),
+            initializer=signal.signal, initargs=(signal.SIGINT, signal.SIG_IGN))
+        for _ in range(self._jobs):
+            self._pool.submit(warm_worker)
+        self._inflight: dict[asyncio.Future, int] = {}
+        self._compiling: set[pathlib.Path] = set()
+        self._requeued: set[pathlib.Path] = set()
+        self.status_changed = asyncio.Event()
+        self._output_dir.mkdir(parents=True, exist_ok=True)
+        self._hashes = ShaderHashCache(output_dir / HASH_CACHE_NAME)
 
     def schedule(self, path: pathlib.Path) -> None:
-        if path in self._tasks:
-            self._tasks[path].cancel()
-        handle = self._loop.call_later(
-            DEBOUNCE_SECONDS, self._compile_sync, path)
-        self._tasks[path] = handle
+        if self._known_sources is not None:
+            self._known_sources.add(path)
+        if path not in self._pending:
+            self._pending.add(path)
+            self.status_changed.set()
+        self._deadline = self._loop.time() + DEBOUNCE_SECONDS
+        if self._timer is None:
+            self._timer = self._loop.call_at(self._deadline, self._maybe_flush)
+
+    def _output_spv(self, path: pathlib.Path) -> pathlib.Path:
+        return self._output_dir / (path.name + '.spv')
+
+    def _compute_key(self, path: pathlib.Path) -> str | None:
+        return shader_key(path, self._output_spv(path), self._include_dir, self._optimize)
+
+    def _is_cached(self, path: pathlib.Path, key: str | None) -> bool:
+        return self._hashes.is_current(path, key, self._output_spv(path))
+
+    def forget(self, path: pathlib.Path) -> None:
+        if path in self._pending:
+            self._pending.discard(path)
+            self.status_changed.set()
+        if self._known_sources is not None:
+            self._known_sources.discard(path)
+
+    def forget_directory(self, directory: pathlib.Path) -> None:
+        removed = {path for path in self._pending
+                   if path.is_relative_to(directory)}
+        if removed:
+            self._pending -= removed
+            self.status_changed.set()
+        if self._known_sources is not None:
+            self._known_sources = {path for path in self._known_sources
+                                   if not path.is_relative_to(directory)}
+
+    def _sources(self) -> list[pathlib.Path]:
+        if self._known_sources is None:
+            self._known_sources = set(find_shaders(self._source_dir))
+        return list(self._known_sources)
+
+    def _maybe_flush(self) -> None:
+        if self._loop.time() < self._deadline:
+            self._timer = self._loop.call_at(self._deadline, self._maybe_flush)
+            return
+        self._flush()
+
+    def _flush(self) -> None:
+        paths = self._pending
+        self._pending = set()
+        self._timer = None
+        self.status_changed.set()
+
+        self._dispatch(self._stale(list(paths)))
+
+    def _dispatch(self, entries: list[tuple[pathlib.Path, str | None]]) -> list[asyncio.Future]:
+        busy = {path for path, _ in entries if path in self._compiling}
+        if busy:
+            self._requeued |= busy
+            entries = [entry for entry in entries if entry[0] not in busy]
+        self._compiling.update(path for path, _ in entries)
+
+        batches = [entries[i::self._jobs]
+                   for i in range(min(self._jobs, len(entries)))]
+        return [self._submit(batch) for batch in batches]
+
+    def _submit(self, entries: list[tuple[pathlib.Path, str | None]]) -> asyncio.Future:
+        future = self._loop.run_in_executor(
+            self._pool, compile_shader_batch,
+            [path for path, _ in entries], self._output_dir, self._include_dir, self._optimize, False)
+        self._inflight[future] = len(entries)
+        self.status_changed.set()
+        future.add_done_callback(
+            functools.partial(self._on_compiled, dict(entries)))
+        return future
+
+    def _on_compiled(self, keys: dict[pathlib.Path, str | None], future: asyncio.Future) -> None:
+        self._inflight.pop(future, None)
+        self._compiling.difference_update(keys)
+        requeued = self._requeued.intersection(keys)
+        self._requeued -= requeued
+        self.status_changed.set()
+        if future.cancelled():
+            return
 
-    def _compile_sync(self, path: pathlib.Path) -> None:
-        self._tasks.pop(path, None)
-        compile_shader(
-            (path, self._output_dir, self._include_dir, self._optimize, False))
+        try:
+            results = future.result()
+        except Exception as e:
+            write_error(f'Shader compile failed: {e}')
+            results = []
+
+        for shader_path, _, error in results:
+            key = keys.get(shader_path)
+            if error:
+                write_error(f'{shader_path.name}: {error}')
+            elif key is not None:
+                self._hashes.record(shader_path, key,
+                                    self._output_spv(shader_path))
+
+        for path in requeued:
+            self.schedule(path)
 
     def cancel_all(self) -> None:
-        for handle in self._tasks.values():
-            handle.cancel()
-        self._tasks.clear()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending.clear()
+        self._requeued.clear()
+        self.status_changed.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._hashes.close()
 
     def pending_count(self) -> int:
-        return len(self._tasks)
-
-    def recompile_all(self) -> None:
-        print(f'{Fore.YELLOW}Cleaning old .spv files...{Style.RESET_ALL}')
-        for spv_file in self._output_dir.rglob('*.spv'):
-            try:
-                spv_file.unlink()
-            except Exception as e:
-                print(
-                    f'{Fore.RED}[Error] Failed to delete {spv_file}: {e}{Style.RESET_ALL}')
-        print(f'{Fore.YELLOW}Recompiling all shaders...{Style.RESET_ALL}')
-        compile_all_shaders(self._source_dir, self._output_dir,
-                            self._optimize, True)
-        print(
-            f'{Fore.CYAN}[Done] Full recompilation finished{Style.RESET_ALL}')
-
-
-class ShaderEventHandler(FileSystemEventHandler):
-    def __init__(self, compiler: DebouncedCompiler):
+        return len(self._pending) + sum(self._inflight.values())
+
+    def _remove_orphans(self, outputs: set[str]) -> None:
+        orphans = [path for path in iter_outputs(str(self._output_dir))
+                   if spv_name(path) not in outputs]
+        with ThreadPoolExecutor(max_workers=UNLINK_WORKERS) as executor:
+            executor.map(remove_file, orphans)
+
+    def _stale(self, paths: list[pathlib.Path]) -> list[tuple[pathlib.Path, str | None]]:
+        return [(path, key) for path in paths
+                if not self._is_cached(path, key := self._compute_key(path))]
+
+    async def compile_stale(self) -> None:
+        shaders = self._sources()
+        stale = self._stale(shaders)
+        if not stale:
+            print(f'All {len(shaders)} shaders up to date')
+            return
+
+        print(f'{len(stale)}/{len(shaders)} shaders stale, compiling...')
+        await asyncio.gather(*self._dispatch(stale), return_exceptions=True)
+
+    async def rebuild_changed(self) -> None:
+        shaders = self._sources()
+        outputs = {path.name + '.spv' for path in shaders}
+
+        write_raw(CLEANING_LINE)
+        await asyncio.to_thread(self._remove_orphans, outputs)
+
+        stale = self._stale(shaders)
+        write_raw(NOTICE_PREFIX +
+                  f'Recompiling {len(stale)}/{len(shaders)} changed shaders...'.encode() + LINE_SUFFIX)
+        await asyncio.gather(*self._dispatch(stale), return_exceptions=True)
+        write_raw(REBUILD_DONE_LINE)
+
+
+class ShaderEventHandler(PatternMatchingEventHandler):
+    def __init__(self, loop: asyncio.AbstractEventLoop, compiler: DebouncedCompiler, ignored_prefix: str | None):
+        super().__init__(
+            patterns=SHADER_PATTERNS,
+            ignore_patterns=IGNORE_PATTERNS,
+            ignore_directories=True,
+            case_sensitive=True,
+        )
+        self._loop = loop
+        self._ignored_prefix = ignored_prefix
+        self._compiler = compiler
+        self._resolved: dict[str, pathlib.Path] = {}
+
+    def _resolve(self, src: str) -> pathlib.Path:
+        resolved = self._resolved.get(src)
+        if resolved is None:
+            resolved = self._resolved.setdefault(src, pathlib.Path(src).resolve())
+        return resolved
+
+    def dispatch(self, event: FileSystemEvent) -> None:
+        if self._ignored_prefix is not None and event.src_path.startswith(self._ignored_prefix) and (
+                event.event_type != EVENT_TYPE_MOVED or event.dest_path.startswith(self._ignored_prefix)):
+            return
+        if event.is_directory and event.event_type in REMOVE_EVENT_TYPES:
+            self._loop.call_soon_threadsafe(
+                self._compiler.forget_directory, self._resolve(event.src_path))
+        super().dispatch(event)
+
+    def on_any_event(self, event: FileSystemEvent) -> None:
+        if event.event_type in REMOVE_EVENT_TYPES and should_compile(event.src_path):
+            self._loop.call_soon_threadsafe(
+                self._compiler.forget, self._resolve(event.src_path))
+
+        if event.event_type not in COMPILE_EVENT_TYPES:
+            return
+
+        if event.event_type == EVENT_TYPE_MOVED:
+            src = event.dest_path
+            if not should_compile(src):
+                return
+        else:
+            src = event.src_path
+
+        self._loop.call_soon_threadsafe(
+            self._compiler.schedule, self._resolve(src))
+
+
+class StdinReader:
+    def __init__(self, loop: asyncio.AbstractEventLoop, compiler: DebouncedCompiler):
+        self._loop = loop
         self._compiler = compiler
+        self._buffer = bytearray()
+        self._tasks: set[asyncio.Task] = set()
+        self._fd: int | None = None
 
-    def on_modified(self, event: FileModifiedEvent) -> None:
-        if not event.is_directory:
-            path = pathlib.Path(event.src_path)
-            if should_compile(path):
-                self._compiler.schedule(path.resolve())
+    def start(self) -> bool:
+        try:
+            fd = sys.stdin.fileno()
+            self._loop.add_reader(fd, self._on_readable)
+        except (AttributeError, NotImplementedError, OSError, ValueError):
+            return False
+        self._fd = fd
+        return True
+
+    def stop(self) -> None:
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+
+    async def close(self) -> None:
+        self.stop()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _on_readable(self) -> None:
+        data = os.read(self._fd, 4096)
+        if not data:
+            self.stop()
+            return
+
+        self._buffer += data
+        *lines, rest = self._buffer.split(b'\n')
+        self._buffer[:] = rest
+        for line in lines:
+            if line.strip().lower() == b'r':
+                task = self._loop.create_task(self._compiler.rebuild_changed())
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
 
 
 async def monitor_user_input(compiler: DebouncedCompiler, stop_event: asyncio.Event) -> None:
     while not stop_event.is_set():
         try:
             line = await asyncio.to_thread(sys.stdin.readline)
+            if not line:
+                break
             if line.strip().lower() == 'r':
-                compiler.recompile_all()
+                await compiler.rebuild_changed()
         except Exception:
             break
 
 
 async def print_status(compiler: DebouncedCompiler, stop_event: asyncio.Event) -> None:
-    while not stop_event.is_set():
+    stopped = asyncio.create_task(stop_event.wait())
+    while True:
+        changed = asyncio.create_task(compiler.status_changed.wait())
+        await asyncio.wait({changed, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        changed.cancel()
+        if stopped.done():
+            return
+
+        compiler.status_changed.clear()
         pending = compiler.pending_count()
+        write_raw(STATUS_PREFIX + str(pending).encode() + STATUS_SUFFIX)
+        await asyncio.sleep(STATUS_INTERVAL_SECONDS)
+
+
+def native_observer_class() -> type[BaseObserver]:
+    if sys.platform.startswith('linux'):
+        from watchdog.observers.inotify import InotifyObserver as NativeObserver
+    elif sys.platform == 'darwin':
+        from watchdog.observers.fsevents import FSEventsObserver as NativeObserver
+    elif sys.platform == 'win32':
+        from watchdog.observers.read_directory_changes import WindowsApiObserver as NativeObserver
+    else:
+        from watchdog.observers.kqueue import KqueueObserver as NativeObserver
+    return NativeObserver
+
+
+def start_observer(handler: PatternMatchingEventHandler, source_dir: pathlib.Path) -> BaseObserver:
+    try:
+        observer = native_observer_class()()
+    except (ImportError, OSError) as e:
+        print(
+            f'{Fore.RED}[Warning] Native file watching is unavailable ({e}), using {Observer.__name__}; '
+            f'shader changes may be detected slowly{Style.RESET_ALL}')
+        observer = Observer()
+
+    observer.schedule(handler, str(source_dir), recursive=True)
+    try:
+        observer.start()
+    except OSError as e:
         print(
-            f'{Fore.BLUE}[Status] Pending shaders: {pending}{Style.RESET_ALL}', end='\r')
-        await asyncio.sleep(1)
+            f'{Fore.RED}[Warning] Native file watching failed ({e}), falling back to polling{Style.RESET_ALL}')
+        observer = PollingObserver()
+        observer.schedule(handler, str(source_dir), recursive=True)
+        observer.start()
+
+    return observer
 
 
 async def main(source: str, output: str, optimize: bool) -> None:
@@ -105,34 +538,49 @@ async def main(source: str, output: str, optimize: bool) -> None:
     output_dir = pathlib.Path(output).resolve()
     include_dir = source_dir / 'include'
 
+    if output_dir == source_dir:
+        print(
+            f'{Fore.RED}[Warning] Writing SPIR-V into the watched source directory {source_dir}; '
+            f'consider a separate --output directory{Style.RESET_ALL}')
+
     loop = asyncio.get_running_loop()
     compiler = DebouncedCompiler(
         loop, output_dir, include_dir, source_dir, optimize)
-    handler = ShaderEventHandler(compiler)
+    await compiler.compile_stale()
+    handler = ShaderEventHandler(
+        loop, compiler, ignored_output_prefix(source_dir, output_dir))
 
-    observer = Observer()
-    observer.schedule(handler, str(source_dir), recursive=True)
-    observer.start()
+    observer = start_observer(handler, source_dir)
 
     stop_event = asyncio.Event()
 
-    def handle_exit(*_):
-        stop_event.set()
+    if sys.platform == 'win32':
+        def handle_exit(*_):
+            loop.call_soon_threadsafe(stop_event.set)
 
-    signal.signal(signal.SIGINT, handle_exit)
-    signal.signal(signal.SIGTERM, handle_exit)
+        signal.signal(signal.SIGINT, handle_exit)
+        signal.signal(signal.SIGTERM, handle_exit)
+    else:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
 
     print(f'Watching {source_dir} for shader changes...')
     print(
-        f"Press {Fore.YELLOW}R{Style.RESET_ALL} + Enter to recompile all shaders.")
+        f"Press {Fore.YELLOW}R{Style.RESET_ALL} + Enter to rebuild changed shaders.")
+
+    stdin_reader = StdinReader(loop, compiler)
+    tasks = [asyncio.create_task(print_status(compiler, stop_event))]
+    if not stdin_reader.start():
+        tasks.append(asyncio.create_task(
+            monitor_user_input(compiler, stop_event)))
 
-    await asyncio.gather(
-        stop_event.wait(),
-        monitor_user_input(compiler, stop_event),
-        print_status(compiler, stop_event),
-    )
+    await stop_event.wait()
 
     print('\nShutting down...')
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await stdin_reader.close()
     observer.stop()
     observer.join()
     compiler.cancel_all()
@@ -147,7 +595,4 @@ if __name__ == '__main__':
     parser.add_argument('--optimize', action='store_true', default=True)
     args = parser.parse_args()
 
-    compile_all_shaders(pathlib.Path(args.source),
-                        pathlib.Path(args.output), args.optimize, True)
-
     asyncio.run(main(args.source, args.output, args.optimize))